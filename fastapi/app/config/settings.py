@@ -1,30 +1,70 @@
 # app/config/settings.py
+from functools import lru_cache
 from pathlib import Path
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings
 from typing import Optional
 
 class Settings(BaseSettings):
-    huggingface_token: Optional[str] = None
+    huggingface_token: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("HUGGINGFACE_TOKEN", "HF_TOKEN")
+    )
     
-    # Best model that works on HuggingFace Inference API (Free tier)
-    # This model is well-supported and works without providers
-    huggingface_model: str = "meta-llama/Llama-3.3-70B-Instruct"
+    # HF router model id (with provider suffix); pick another at deploy time via HF_MODEL
+    huggingface_model: str = Field(
+        default="meta-llama/Llama-3.3-70B-Instruct:groq",
+        validation_alias=AliasChoices("HUGGINGFACE_MODEL", "HF_MODEL")
+    )
     
-    # Alternative models if the above doesn't work (will auto-fallback):
+    # Alternatives if the above is unavailable:
     # - "meta-llama/Llama-3.2-3B-Instruct" (smaller, faster)
-    # - "microsoft/phi-2" (very reliable)
     # - "mistralai/Mistral-7B-Instruct-v0.2" (solid backup)
     
     mongodb_uri: Optional[str] = None
     mongodb_database: str = "audynce"
+    # Seconds before MongoDB's TTL monitor drops a cached analysis; 0 keeps entries forever.
+    # Only applied when the index is first created: changing it later needs a collMod on the index
+    cache_ttl: int = 30 * 24 * 3600
     story_mode_threshold: int = 30
     max_scenes: int = 5
     port: int = 8000
 
+    # LLM call budget: two attempts of llm_call_timeout must fit in the backend's 30s timeout
+    llm_connect_timeout: float = 5.0
+    llm_read_timeout: float = 10.0
+    llm_call_timeout: float = 12.0
+    llm_max_retries: int = 2
+    # Concurrent model calls per worker; keeps bursts under the provider's rate limit
+    llm_inflight_limit: int = 32
+    # Replies are a couple of short JSON strings; this is a ceiling, not a target
+    llm_max_tokens: int = 256
+    # Ask the router for response_format=json_object; disable for providers that reject it
+    llm_json_mode: bool = True
+
+    # Semantic cache (opt-in): on an exact-hash miss, reuse an analysis whose prompt embedding is within
+    # semantic_cache_threshold cosine similarity. Needs an Atlas Vector Search index, see README
+    semantic_cache_enabled: bool = False
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_timeout: float = 2.0
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_index: str = "analysis_embedding"
+    # Only DIRECT prompts up to this length are embedded: all-MiniLM-L6-v2 truncates at 256 word pieces,
+    # so longer prompts sharing an opening would look identical
+    semantic_cache_max_chars: int = 500
+
+    # Only browser origin allowed through CORS; the Spring Boot backend calls server-to-server
+    frontend_origin: str = "https://audynce.vercel.app"
+
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
         "protected_namespaces": ()
     }
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Parse .env and the environment once and reuse the result"""
+    return Settings()
+
+settings = get_settings()
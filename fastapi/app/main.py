@@ -1,15 +1,25 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 import logging
 import os
+import sys
+from typing import List, Optional, Tuple
+import httpx
+import orjson
 import uvicorn
+from pydantic import BaseModel
 
-from app.models.schemas import AnalysisRequest, AIAnalysisResponse
+from app.models.schemas import (
+    AnalysisMode, AnalysisRequest, AIAnalysisResponse, AnalysisStreamHeader, SceneAnalysis
+)
 from app.services.ai_service import AIService
+from app.services.embedding_service import EmbeddingService
 from app.services.cache_service import cache_service
-from app.config.settings import settings
+from app.services.local_cache import local_cache
+from app.config.settings import Settings, get_settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,31 +30,47 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting FastAPI service...")
     await cache_service.connect()
+    app.state.http_client = httpx.AsyncClient(
+        timeout=120.0,
+        http2=True,
+        limits=httpx.Limits(max_connections=512, max_keepalive_connections=256, keepalive_expiry=30.0)
+    )
+    app.state.ai_service = AIService(app.state.http_client)
+    app.state.embedding_service = (
+        EmbeddingService(app.state.http_client) if get_settings().semantic_cache_enabled else None
+    )
+    await app.state.ai_service.warm_up()
     yield
     # Shutdown
     logger.info("Shutting down FastAPI service...")
+    await app.state.http_client.aclose()
     await cache_service.close()
 
 app = FastAPI(
     title="Audynce AI Service",
     description="AI-powered story analysis for music playlist generation",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[get_settings().frontend_origin],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
-ai_service = AIService()
+def get_ai_service(request: Request) -> AIService:
+    return request.app.state.ai_service
+
+def get_embedding_service(request: Request) -> Optional[EmbeddingService]:
+    return request.app.state.embedding_service
 
 @app.get("/")
-async def root():
+async def root(settings: Settings = Depends(get_settings)):
     return {
         "service": "Audynce AI",
         "status": "running",
@@ -52,45 +78,165 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
+async def health_check(settings: Settings = Depends(get_settings)):
     return {
         "status": "healthy",
         "model": settings.huggingface_model,
         "mongodb": "connected" if cache_service.collection is not None else "disconnected"
     }
 
+def _semantic_cache_applies(request: AnalysisRequest) -> bool:
+    # Story analyses hinge on the whole text, and long prompts overrun the embedding model's window;
+    # only short DIRECT requests are safe to answer with a paraphrase's analysis
+    return (
+        request.analysis_mode == AnalysisMode.DIRECT
+        and len(request.prompt) <= get_settings().semantic_cache_max_chars
+    )
+
+async def _find_cached(
+    request: AnalysisRequest, embedding_service: Optional[EmbeddingService]
+) -> Tuple[Optional[dict], Optional[List[float]]]:
+    """
+    Check the in-process cache, then MongoDB by hash, then (if enabled) by prompt similarity.
+    Returns the prompt embedding alongside so a miss can be stored with it.
+    """
+    cached = local_cache.get(request.canonical_key)
+    if cached:
+        logger.info("Returning locally cached analysis")
+        return cached, None
+
+    cached = await cache_service.get_cached_analysis(request.cache_digest)
+    if cached:
+        logger.info("Returning cached analysis")
+        local_cache.set(request.canonical_key, cached)
+        return cached, None
+
+    if embedding_service is None or not _semantic_cache_applies(request):
+        return None, None
+    embedding = await embedding_service.embed(request.prompt)
+    if embedding is None:
+        return None, None
+    cached = await cache_service.get_semantically_cached(
+        embedding, request.cache_variant, get_settings().semantic_cache_threshold
+    )
+    if cached:
+        logger.info("Returning semantically cached analysis (score %.3f)", cached.pop("score"))
+        local_cache.set(request.canonical_key, cached)
+    return cached, embedding
+
+async def _store_analysis(
+    request: AnalysisRequest, analysis: AIAnalysisResponse, embedding: Optional[List[float]] = None
+):
+    # Cache the result, unless a fallback stood in for the model
+    if analysis.cacheable:
+        analysis_data = analysis.model_dump(mode="json")
+        local_cache.set(request.canonical_key, analysis_data)
+        await cache_service.cache_analysis(
+            request.cache_digest, analysis_data, embedding, request.cache_variant
+        )
+
+def _ndjson_line(part: BaseModel, **dump_options) -> bytes:
+    return part.model_dump_json(**dump_options).encode() + b"\n"
+
 @app.post("/ai/analyze", response_model=AIAnalysisResponse)
-async def analyze_story(request: AnalysisRequest):
+async def analyze_story(
+    request: AnalysisRequest,
+    ai_service: AIService = Depends(get_ai_service),
+    embedding_service: Optional[EmbeddingService] = Depends(get_embedding_service)
+):
     """
     Analyze a story or prompt and return structured scene breakdown
     """
     try:
-        logger.info(f"Received analysis request: {len(request.prompt)} chars")
-        
-        # Check cache first
-        prompt_hash = str(hash(request.prompt))
-        cached = await cache_service.get_cached_analysis(prompt_hash)
+        logger.info("Received analysis request: %d chars", len(request.prompt))
         
+        cached, embedding = await _find_cached(request, embedding_service)
         if cached:
-            logger.info("Returning cached analysis")
             return AIAnalysisResponse(**cached)
         
         # Analyze with AI
         analysis = await ai_service.analyze_prompt(
             request.prompt,
             request.selected_genres,
-            request.story_threshold
+            request.story_threshold,
+            request.cache_digest
         )
         
-        # Cache the result
-        await cache_service.cache_analysis(prompt_hash, analysis.dict())
-        
+        await _store_analysis(request, analysis, embedding)
         return analysis
         
     except Exception as e:
-        logger.error(f"Error in analyze_story: {e}")
+        logger.error("Error in analyze_story: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ai/analyze/stream")
+async def analyze_story_stream(
+    request: AnalysisRequest,
+    ai_service: AIService = Depends(get_ai_service),
+    embedding_service: Optional[EmbeddingService] = Depends(get_embedding_service)
+):
+    """
+    Stream the analysis as NDJSON: an analysis_id/mode/scene_count header line, then each scene
+    (or the direct analysis) as soon as it is ready. A failure mid-stream ends with an
+    {"error": ...} line, so a client that got fewer than scene_count scenes knows why.
+    """
+    logger.info("Received streaming analysis request: %d chars", len(request.prompt))
+
+    async def lines():
+        parts = None
+        try:
+            cached, embedding = await _find_cached(request, embedding_service)
+            if cached:
+                analysis = AIAnalysisResponse(**cached)
+                yield _ndjson_line(AnalysisStreamHeader(
+                    analysis_id=analysis.analysis_id,
+                    mode=analysis.mode,
+                    scene_count=len(analysis.scenes) if analysis.scenes is not None else None
+                ), exclude_none=True)
+                for part in analysis.scenes or [analysis.direct_analysis]:
+                    yield _ndjson_line(part)
+                return
+
+            parts = ai_service.stream_prompt(
+                request.prompt,
+                request.selected_genres,
+                request.story_threshold,
+                request.cache_digest
+            )
+            header = await parts.__anext__()
+            yield _ndjson_line(header, exclude_none=True)
+            analysis = AIAnalysisResponse(analysis_id=header.analysis_id, mode=header.mode)
+            async for part in parts:
+                yield _ndjson_line(part)
+                if isinstance(part, SceneAnalysis):
+                    analysis.scenes = (analysis.scenes or []) + [part]
+                else:
+                    analysis.direct_analysis = part
+
+            if analysis.scenes:
+                analysis.scenes.sort(key=lambda scene: scene.scene_number)
+            await _store_analysis(request, analysis, embedding)
+
+        except Exception as e:
+            # The 200 status is already sent; tell the client why the stream ends early
+            logger.error("Error in analyze_story_stream: %s", e)
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+        finally:
+            if parts is not None:
+                # Cancels any scene calls still running now, not whenever the generator is collected
+                await parts.aclose()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Import string so each worker builds its own AIService and connection pool in lifespan
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=port,
+        # uvloop has no Windows build; use the stock asyncio loop there
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WORKERS", "1"))
+    )
\ No newline at end of file
@@ -0,0 +1,26 @@
+# app/models/llm_output.py
+"""msgspec mirrors of the JSON exchanged with the model.
+
+These are decode-only shapes used inside the AI service; the pydantic
+models in schemas.py remain the API boundary.
+"""
+from typing import List, Optional
+import msgspec
+
+class SceneMsg(msgspec.Struct, frozen=True):
+    description: Optional[str] = None
+    search_query: Optional[str] = None
+
+class DirectMsg(msgspec.Struct, frozen=True):
+    theme: Optional[str] = None
+    search_query: Optional[str] = None
+
+# Only the parts of an OpenAI-style chat completion body that the service reads
+class ChatMessageMsg(msgspec.Struct, frozen=True):
+    content: Optional[str] = None
+
+class ChatChoiceMsg(msgspec.Struct, frozen=True):
+    message: ChatMessageMsg
+
+class ChatCompletionMsg(msgspec.Struct, frozen=True):
+    choices: List[ChatChoiceMsg]
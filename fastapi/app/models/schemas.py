@@ -1,8 +1,12 @@
 # app/models/schemas.py
-from pydantic import BaseModel, Field
+from functools import cached_property
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 from typing import List, Optional
 from enum import Enum
 
+from app.utils.hashing import prompt_key, prompt_digest, variant_key
+from app.utils.prompt_builder import is_story_prompt
+
 class MoodType(str, Enum):
     UPBEAT = "UPBEAT"
     MELANCHOLIC = "MELANCHOLIC"
@@ -25,18 +29,72 @@ class AnalysisRequest(BaseModel):
     selected_genres: List[str] = Field(default_factory=list)
     story_threshold: int = 100
 
-class SceneAnalysis(BaseModel):
+    @field_validator("selected_genres")
+    @classmethod
+    def canonicalize_genres(cls, v: List[str]) -> List[str]:
+        # Order and duplicates carry no meaning; normalising them makes cache keys order-independent
+        return sorted(set(v))
+
+    @cached_property
+    def canonical_key(self) -> str:
+        """Cache key material for this request, built once per request"""
+        return prompt_key(self.prompt, self.selected_genres, self.story_threshold)
+
+    @cached_property
+    def cache_digest(self) -> str:
+        """MongoDB cache key and analysis_id seed, hashed once per request"""
+        return prompt_digest(self.canonical_key)
+
+    @cached_property
+    def analysis_mode(self) -> AnalysisMode:
+        """The mode AIService will analyze this request in"""
+        return AnalysisMode.STORY if is_story_prompt(self.prompt, self.story_threshold) else AnalysisMode.DIRECT
+
+    @cached_property
+    def cache_variant(self) -> str:
+        """Genres, threshold and mode, which a semantically similar prompt must share to reuse its analysis"""
+        return variant_key(self.selected_genres, self.story_threshold, self.analysis_mode.value)
+
+class _AnalysisPart(BaseModel):
+    # Rule-based stand-ins are served to the caller but never cached
+    _is_fallback: bool = PrivateAttr(default=False)
+
+    @classmethod
+    def fallback(cls, **data):
+        """Build a rule-based stand-in for a failed model call"""
+        part = cls(**data)
+        part._is_fallback = True
+        return part
+
+    @property
+    def is_fallback(self) -> bool:
+        return self._is_fallback
+
+class SceneAnalysis(_AnalysisPart):
     scene_number: int
     description: str
     
     search_query: str = Field(..., description="The final Spotify search query for this scene")
 
-class DirectModeAnalysis(BaseModel):
+class DirectModeAnalysis(_AnalysisPart):
     theme: str 
     search_query: str = Field(..., description="The final Spotify search query for this request")
 
+class AnalysisStreamHeader(BaseModel):
+    """First line of a streamed analysis"""
+    analysis_id: str
+    mode: AnalysisMode
+    scene_count: Optional[int] = Field(None, description="Scene lines that follow, in STORY mode")
+
 class AIAnalysisResponse(BaseModel):
     analysis_id: str
     mode: AnalysisMode
     scenes: Optional[List[SceneAnalysis]] = None
-    direct_analysis: Optional[DirectModeAnalysis] = None
\ No newline at end of file
+    direct_analysis: Optional[DirectModeAnalysis] = None
+
+    @property
+    def cacheable(self) -> bool:
+        """False when any part of the analysis came from a fallback"""
+        if self.direct_analysis is not None and self.direct_analysis.is_fallback:
+            return False
+        return not any(scene.is_fallback for scene in self.scenes or [])
@@ -1,133 +1,287 @@
 # app/services/ai_service.py
-import os
+import asyncio
 import json
 import logging
-import time
-from typing import List, Optional
-from openai import OpenAI
+from typing import AsyncIterator, Awaitable, Dict, List, Tuple, Type, TypeVar, Union
+import httpx
+import msgspec
+from openai import AsyncOpenAI, NOT_GIVEN
+from pydantic import BaseModel
 
 from app.config.settings import settings
 from app.models.schemas import (
-    AnalysisMode, MoodType, SceneAnalysis,
-    DirectModeAnalysis, AIAnalysisResponse
+    AnalysisMode, SceneAnalysis,
+    DirectModeAnalysis, AIAnalysisResponse, AnalysisStreamHeader
+)
+from app.models.llm_output import SceneMsg, DirectMsg, ChatCompletionMsg
+from app.utils.json_extract import first_json_object
+from app.utils.prompt_builder import (
+    is_story_prompt, split_story, build_scene_prompt, build_direct_prompt,
+    SCENE_SYSTEM_PROMPT, DIRECT_SYSTEM_PROMPT
 )
-from app.utils.prompt_builder import build_story_prompt, build_direct_prompt
 
 logger = logging.getLogger(__name__)
 
+ROUTER_BASE_URL = "https://router.huggingface.co/v1"
+
+# Identical on every call of a kind; only the user message varies per request
+_SCENE_SYSTEM_MESSAGE = {"role": "system", "content": SCENE_SYSTEM_PROMPT}
+_DIRECT_SYSTEM_MESSAGE = {"role": "system", "content": DIRECT_SYSTEM_PROMPT}
+
+# Rule-based stand-ins, one story beat per scene up to the default max_scenes; beyond that they cycle
+_FALLBACK_BEATS = (
+    ("Opening - Setting the mood", "peaceful {}"),
+    ("Development - Rising action", "upbeat {}"),
+    ("Turning point - Tension builds", "dramatic {} dark"),
+    ("Climax - Emotional high point", "intense {} epic"),
+    ("Resolution - Calm ending", "nostalgic {} chill"),
+)
+
+# Without genres the fallbacks are fixed, so build them once instead of per failure
+_DEFAULT_FALLBACK_SCENES = tuple(
+    SceneAnalysis.fallback(scene_number=i, description=description, search_query=query.format("pop"))
+    for i, (description, query) in enumerate(_FALLBACK_BEATS, 1)
+)
+_DEFAULT_FALLBACK_DIRECT = DirectModeAnalysis.fallback(theme="General playlist", search_query="pop indie")
+
+_JSON_MODE = {"type": "json_object"}
+
+T = TypeVar("T")
+
 class AIService:
-    def __init__(self):
-        token = settings.huggingface_token or os.getenv("HF_TOKEN")
+    def __init__(self, http_client: httpx.AsyncClient):
+        token = settings.huggingface_token
         if not token:
             logger.warning("⚠️ Missing HF_TOKEN in environment or .env file!")
         else:
-            logger.info(f"✓ HuggingFace token loaded ({token[:10]}...)")
+            logger.info("✓ HuggingFace token loaded")
 
-        self.client = OpenAI(
-            base_url="https://router.huggingface.co/v1",
-            api_key=token
+        # Reuse the app-wide connection pool so keep-alive connections survive across requests
+        self.http_client = http_client
+        self.client = AsyncOpenAI(
+            base_url=ROUTER_BASE_URL,
+            api_key=token,
+            http_client=http_client,
+            timeout=httpx.Timeout(settings.llm_read_timeout, connect=settings.llm_connect_timeout),
+            max_retries=settings.llm_max_retries
         )
-        self.model = "meta-llama/Llama-3.3-70B-Instruct:groq" 
+        self.model = settings.huggingface_model
+        # Caps concurrent model calls across all requests to stay inside the provider's rate limits
+        self._llm_semaphore = asyncio.Semaphore(settings.llm_inflight_limit)
+        self._llm_inflight = 0
+        self._llm_queued = 0
+        # Analyses currently running, keyed by cache digest, so identical concurrent requests share one
+        self._inflight: Dict[str, asyncio.Task] = {}
 
-    async def analyze_prompt(self, prompt: str, selected_genres: List[str], story_threshold: int) -> AIAnalysisResponse:
-        word_count = len(prompt.split())
-        mode = AnalysisMode.STORY if word_count >= story_threshold else AnalysisMode.DIRECT
-        logger.info(f"Analyzing prompt ({word_count} words) in {mode} mode")
+    async def warm_up(self):
+        """Open a pooled connection to the router so the first analysis skips the TLS handshake"""
+        try:
+            await self.http_client.head(ROUTER_BASE_URL, timeout=settings.llm_connect_timeout)
+            logger.info("✓ Warmed up connection to HF router")
+        except httpx.HTTPError as e:
+            logger.warning("Router warm-up failed: %s", e)
 
-        analysis_id = f"ai-{hash(prompt)}-{int(time.time())}"
+    async def analyze_prompt(
+        self, prompt: str, selected_genres: List[str], story_threshold: int, analysis_id_seed: str
+    ) -> AIAnalysisResponse:
+        # The seed is the request's cache digest, so equal seeds mean equal requests
+        task = self._inflight.get(analysis_id_seed)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._run_analysis(prompt, selected_genres, story_threshold, analysis_id_seed)
+            )
+            self._inflight[analysis_id_seed] = task
+            task.add_done_callback(lambda _: self._inflight.pop(analysis_id_seed, None))
+        else:
+            logger.info("Joining in-flight analysis %s", analysis_id_seed[:16])
+        # Shielded so one caller going away doesn't cancel the run the others are waiting on
+        return await asyncio.shield(task)
+
+    async def analyze_prompts_batch(
+        self, items: List[Tuple[str, List[str], int, str]]
+    ) -> List[Union[AIAnalysisResponse, BaseException]]:
+        """
+        Analyze (prompt, genres, story_threshold, analysis_id_seed) items concurrently, in input order.
+        Like analyze_prompt this never reads or writes the L1/Mongo caches; callers check and fill them.
+        """
+        # No batch-level limit: every model call already queues on the shared llm_inflight_limit semaphore
+        return await asyncio.gather(*(self.analyze_prompt(*item) for item in items), return_exceptions=True)
+
+    async def _run_analysis(
+        self, prompt: str, selected_genres: List[str], story_threshold: int, analysis_id_seed: str
+    ) -> AIAnalysisResponse:
+        analysis = self._new_analysis(prompt, story_threshold, analysis_id_seed)
 
-        if mode == AnalysisMode.STORY:
-            scenes = await self._analyze_story(prompt, selected_genres)
-            return AIAnalysisResponse(analysis_id=analysis_id, mode=mode, scenes=scenes)
+        if analysis.mode == AnalysisMode.STORY:
+            analysis.scenes = await self._analyze_story(prompt, selected_genres)
         else:
-            direct = await self._analyze_direct(prompt, selected_genres)
-            return AIAnalysisResponse(analysis_id=analysis_id, mode=mode, direct_analysis=direct)
+            analysis.direct_analysis = await self._analyze_direct(prompt, selected_genres)
+        return analysis
+
+    async def stream_prompt(
+        self, prompt: str, selected_genres: List[str], story_threshold: int, analysis_id_seed: str
+    ) -> AsyncIterator[BaseModel]:
+        """Yield an AnalysisStreamHeader, then each part as soon as it is ready"""
+        analysis = self._new_analysis(prompt, story_threshold, analysis_id_seed)
+
+        if analysis.mode == AnalysisMode.DIRECT:
+            yield AnalysisStreamHeader(analysis_id=analysis.analysis_id, mode=analysis.mode)
+            yield await self._analyze_direct(prompt, selected_genres)
+            return
+
+        passages = split_story(prompt, settings.max_scenes)
+        yield AnalysisStreamHeader(analysis_id=analysis.analysis_id, mode=analysis.mode, scene_count=len(passages))
+
+        # Scenes arrive in completion order; scene_number tells the client where each belongs
+        tasks = [asyncio.ensure_future(call) for call in self._scene_calls(prompt, passages, selected_genres)]
+        try:
+            for next_scene in asyncio.as_completed(tasks):
+                yield await next_scene
+        finally:
+            # The client may disconnect mid-stream; don't leave model calls running for nobody
+            for task in tasks:
+                task.cancel()
+
+    def _new_analysis(self, prompt: str, story_threshold: int, analysis_id_seed: str) -> AIAnalysisResponse:
+        mode = AnalysisMode.STORY if is_story_prompt(prompt, story_threshold) else AnalysisMode.DIRECT
+        logger.info("Analyzing prompt (%d chars) in %s mode", len(prompt), mode.value)
+
+        # The seed is the request's cache digest: the same request gets the same id on every worker,
+        # matching what a cache hit returns, and the prompt is not hashed a second time
+        analysis_id = f"ai-{analysis_id_seed}"
+        return AIAnalysisResponse(analysis_id=analysis_id, mode=mode)
 
     async def _analyze_story(self, prompt: str, genres: List[str]) -> List[SceneAnalysis]:
-        system_prompt = build_story_prompt(prompt, genres)
+        scenes = await asyncio.gather(*self._scene_calls(prompt, split_story(prompt, settings.max_scenes), genres))
+        logger.info("✓ Analyzed %d scenes", len(scenes))
+        return list(scenes)
+
+    def _scene_calls(self, prompt: str, passages: List[str], genres: List[str]) -> List[Awaitable[SceneAnalysis]]:
+        # Shared by every scene of the request rather than re-joined per scene
+        default_query = self._default_query(genres)
+        return [
+            self._analyze_scene(prompt, passage, i, len(passages), genres, default_query)
+            for i, passage in enumerate(passages, 1)
+        ]
+
+    async def _analyze_scene(
+        self, story: str, passage: str, scene_number: int, total_scenes: int,
+        genres: List[str], default_query: str
+    ) -> SceneAnalysis:
         try:
-            response = self._call_huggingface(system_prompt)
-            return self._parse_story_response(response, genres)
+            response = await self._call_with_deadline(
+                _SCENE_SYSTEM_MESSAGE, build_scene_prompt(story, passage, scene_number, total_scenes, genres)
+            )
+            return self._parse_scene_response(response, scene_number, default_query)
         except Exception as e:
-            logger.error(f"Story analysis failed: {e}")
-            return self._fallback_story_scenes(prompt, genres)
+            # A failed scene falls back on its own so the other scenes still reach the caller
+            logger.warning("Scene %d analysis failed: %s", scene_number, e)
+            return self._fallback_scene(scene_number, genres)
 
     async def _analyze_direct(self, prompt: str, genres: List[str]) -> DirectModeAnalysis:
-        system_prompt = build_direct_prompt(prompt, genres)
+        user_prompt = build_direct_prompt(prompt, genres)
         try:
-            response = self._call_huggingface(system_prompt)
+            response = await self._call_with_deadline(_DIRECT_SYSTEM_MESSAGE, user_prompt)
             return self._parse_direct_response(response, genres)
         except Exception as e:
-            logger.error(f"Direct analysis failed: {e}")
+            logger.error("Direct analysis failed: %s", e)
             return self._fallback_direct_analysis(prompt, genres)
 
-    def _call_huggingface(self, prompt: str) -> str:
+    async def _call_with_deadline(self, system_message: dict, prompt: str) -> str:
+        """Bound each model call, giving a timed-out call one retry before callers fall back"""
+        # Wait for a slot outside the deadline, so queueing behind other calls never counts as a timeout
+        self._llm_queued += 1
         try:
-            logger.info(f"Calling HF router model: {self.model}")
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI that returns structured JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=800,
-                temperature=0.7
+            await self._llm_semaphore.acquire()
+        finally:
+            self._llm_queued -= 1
+        self._llm_inflight += 1
+        try:
+            logger.info(
+                "Calling HF router model: %s (llm_inflight=%d, llm_queued=%d)",
+                self.model, self._llm_inflight, self._llm_queued
             )
+            for attempt in (1, 2):
+                try:
+                    return await asyncio.wait_for(self._call_huggingface(system_message, prompt), timeout=settings.llm_call_timeout)
+                except asyncio.TimeoutError:
+                    if attempt == 2:
+                        raise TimeoutError(f"Model call exceeded {settings.llm_call_timeout}s twice") from None
+                    logger.warning("Model call exceeded %ss, retrying once", settings.llm_call_timeout)
+        finally:
+            self._llm_inflight -= 1
+            self._llm_semaphore.release()
 
-            content = completion.choices[0].message.content or ""
-            logger.info(f"✓ API call successful ({len(content)} chars)")
-            return content.strip()
-        except Exception as e:
-            logger.error(f"API call failed: {e}")
-            raise
+    async def _call_huggingface(self, system_message: dict, prompt: str) -> str:
+        # Raw response: decode the body bytes ourselves instead of building the SDK's pydantic models
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=[system_message, {"role": "user", "content": prompt}],
+            max_tokens=settings.llm_max_tokens,
+            temperature=0.7,
+            response_format=_JSON_MODE if settings.llm_json_mode else NOT_GIVEN
+        )
 
-    def _parse_story_response(self, response: str, genres: List[str]) -> List[SceneAnalysis]:
-        try:
-            json_data = self._extract_json(response)
-            scenes = []
-            for i, sc in enumerate(json_data.get("scenes", [])[:settings.max_scenes], 1):
-                scenes.append(SceneAnalysis(
-                    scene_number=i,
-                    description=sc.get("description", f"Scene {i}"),
-                    search_query=sc.get("search_query", " ".join(genres) if genres else "popular music")
-                ))
-            logger.info(f"✓ Parsed {len(scenes)} scenes")
-            return scenes
-        except Exception as e:
-            logger.warning(f"Failed to parse story response: {e}")
-            return self._fallback_story_scenes("", genres)
+        completion = msgspec.json.decode(raw.content, type=ChatCompletionMsg)
+        content = completion.choices[0].message.content or ""
+        logger.info("✓ API call successful (%d chars)", len(content))
+        return content.strip()
+
+    def _parse_scene_response(self, response: str, scene_number: int, default_query: str) -> SceneAnalysis:
+        scene = self._extract_json(response, SceneMsg)
+        return SceneAnalysis(
+            scene_number=scene_number,
+            description=scene.description or f"Scene {scene_number}",
+            search_query=scene.search_query or default_query
+        )
 
     def _parse_direct_response(self, response: str, genres: List[str]) -> DirectModeAnalysis:
         try:
-            json_data = self._extract_json(response)
+            direct = self._extract_json(response, DirectMsg)
             return DirectModeAnalysis(
-                theme=json_data.get("theme", "Music playlist"),
-                search_query=json_data.get("search_query", " ".join(genres) if genres else "popular music")
+                theme=direct.theme or "Music playlist",
+                search_query=direct.search_query or self._default_query(genres)
             )
         except Exception as e:
-            logger.warning(f"Failed to parse direct response: {e}")
+            logger.warning("Failed to parse direct response: %s", e)
             return self._fallback_direct_analysis("", genres)
 
-    def _extract_json(self, text: str) -> dict:
-        start, end = text.find('{'), text.rfind('}') + 1
-        if start == -1 or end <= start:
+    @staticmethod
+    def _default_query(genres: List[str]) -> str:
+        # Used when the model returns an empty search_query
+        return " ".join(genres) if genres else "popular music"
+
+    def _extract_json(self, text: str, type: Type[T]) -> T:
+        # JSON mode normally yields a bare object; scrape only when the model wrapped it in prose
+        block = text if text.startswith("{") and text.endswith("}") else first_json_object(text)
+        if block is None:
             raise ValueError("No JSON detected in model output")
-        return json.loads(text[start:end])
+        try:
+            return msgspec.json.decode(block, type=type)
+        except msgspec.ValidationError:
+            raise
+        except msgspec.DecodeError:
+            # Models sometimes emit raw newlines inside strings; stdlib json tolerates them when not strict
+            return msgspec.convert(json.loads(block, strict=False), type=type)
 
-    def _fallback_story_scenes(self, prompt: str, selected_genres: List[str]) -> List[SceneAnalysis]:
-        logger.info("Using rule-based fallback for story scenes")
-        genre_str = " ".join(selected_genres) if selected_genres else "pop"
-        return [
-            SceneAnalysis(scene_number=1, description="Opening - Setting the mood", search_query=f"peaceful {genre_str}"),
-            SceneAnalysis(scene_number=2, description="Development - Rising action", search_query=f"upbeat {genre_str}"),
-            SceneAnalysis(scene_number=3, description="Climax - Emotional high point", search_query=f"intense {genre_str} epic"),
-            SceneAnalysis(scene_number=4, description="Resolution - Calm ending", search_query=f"nostalgic {genre_str} chill")
-        ]
+    def _fallback_scene(self, scene_number: int, selected_genres: List[str]) -> SceneAnalysis:
+        beat = (scene_number - 1) % len(_FALLBACK_BEATS)
+        if not selected_genres:
+            return _DEFAULT_FALLBACK_SCENES[beat].model_copy(update={"scene_number": scene_number})
+        description, query = _FALLBACK_BEATS[beat]
+        return SceneAnalysis.fallback(
+            scene_number=scene_number,
+            description=description,
+            search_query=query.format(" ".join(selected_genres))
+        )
 
     def _fallback_direct_analysis(self, prompt: str, selected_genres: List[str]) -> DirectModeAnalysis:
         logger.info("Using rule-based fallback for direct analysis")
+        if not prompt and not selected_genres:
+            # Shared instance; response parts are never mutated after construction
+            return _DEFAULT_FALLBACK_DIRECT
         genre_str = " ".join(selected_genres) if selected_genres else "pop indie"
-        return DirectModeAnalysis(
+        return DirectModeAnalysis.fallback(
             theme=prompt[:50] if prompt else "General playlist",
-            search_query=f"{prompt} {genre_str}"
-        )
\ No newline at end of file
+            search_query=f"{prompt} {genre_str}" if prompt else genre_str
+        )
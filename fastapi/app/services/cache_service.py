@@ -1,16 +1,30 @@
 # app/services/cache_service.py
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from app.config.settings import settings
 import logging
 from datetime import datetime
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Only the AIAnalysisResponse fields; skips _id, bookkeeping and the embedding vector
+_ANALYSIS_PROJECTION = {"_id": 0, "analysis_id": 1, "mode": 1, "scenes": 1, "direct_analysis": 1}
+
+# Cache writes are queued and sent as one unordered bulk_write per window, or sooner once a batch fills
+_FLUSH_INTERVAL = 0.1
+_FLUSH_BATCH = 64
+
 class CacheService:
     def __init__(self):
         self.client = None
         self.db = None
         self.collection = None
+        self._index_task = None
+        self._pending: List[UpdateOne] = []
+        self._flush_task = None
+        self._stopping = asyncio.Event()
     
     async def connect(self):
         """Connect to MongoDB"""
@@ -18,12 +32,35 @@ class CacheService:
             self.client = AsyncIOMotorClient(settings.mongodb_uri)
             self.db = self.client[settings.mongodb_database]
             self.collection = self.db["ai_analysis_cache"]
+            # In the background: the client connects lazily, and startup shouldn't wait on an unreachable server
+            self._index_task = asyncio.create_task(self._ensure_indexes())
+            self._flush_task = asyncio.create_task(self._flusher())
             logger.info("Connected to MongoDB")
         except Exception as e:
-            logger.error(f"MongoDB connection failed: {e}")
+            logger.error("MongoDB connection failed: %s", e)
+    
+    async def _ensure_indexes(self):
+        """Create the lookup and expiry indexes (no-ops when they already exist)"""
+        try:
+            await self.collection.create_index("prompt_hash", unique=True)
+            if settings.cache_ttl > 0:
+                # An existing cached_at index with another expireAfterSeconds fails here with an
+                # options conflict; change the TTL with collMod instead
+                await self.collection.create_index("cached_at", expireAfterSeconds=settings.cache_ttl)
+            logger.info("MongoDB cache indexes ready")
+        except Exception as e:
+            logger.error("Error creating cache indexes: %s", e)
     
     async def close(self):
         """Close MongoDB connection"""
+        if self._index_task is not None:
+            self._index_task.cancel()
+        if self._flush_task is not None:
+            # Let the flusher finish any bulk_write already in flight rather than cancelling it mid-batch
+            self._stopping.set()
+            await self._flush_task
+            # Then drain whatever was queued after its last pass
+            await self._flush()
         if self.client is not None:
             self.client.close()
             logger.info("Closed MongoDB connection")
@@ -34,25 +71,73 @@ class CacheService:
             return None
         
         try:
-            result = await self.collection.find_one({"prompt_hash": prompt_hash})
+            result = await self.collection.find_one({"prompt_hash": prompt_hash}, _ANALYSIS_PROJECTION)
             return result
         except Exception as e:
-            logger.error(f"Error retrieving from cache: {e}")
+            logger.error("Error retrieving from cache: %s", e)
             return None
     
-    async def cache_analysis(self, prompt_hash: str, analysis: dict):
-        """Store analysis in cache"""
+    async def get_semantically_cached(self, embedding: List[float], variant: str, threshold: float):
+        """Retrieve the closest cached analysis for the same variant, if its prompt is similar enough"""
         if self.collection is None:
+            return None
+        
+        pipeline = [
+            {"$vectorSearch": {
+                "index": settings.semantic_cache_index,
+                "path": "embedding",
+                "queryVector": embedding,
+                "numCandidates": 20,
+                "limit": 1,
+                "filter": {"variant": variant}
+            }},
+            # Atlas reports cosine similarity rescaled to (1 + cos) / 2
+            {"$set": {"score": {"$meta": "vectorSearchScore"}}},
+            {"$match": {"score": {"$gte": (1 + threshold) / 2}}},
+            # Same shape as the exact-hash lookup, plus the score
+            {"$project": {**_ANALYSIS_PROJECTION, "score": 1}}
+        ]
+        try:
+            async for result in self.collection.aggregate(pipeline):
+                return result
+            return None
+        except Exception as e:
+            logger.error("Error searching semantic cache: %s", e)
+            return None
+    
+    async def cache_analysis(
+        self, prompt_hash: str, analysis: dict,
+        embedding: Optional[List[float]] = None, variant: Optional[str] = None
+    ):
+        """Queue analysis for the cache, with its prompt embedding when the semantic cache is on"""
+        if self.collection is None:
+            return
+        
+        document = {**analysis, "cached_at": datetime.utcnow()}
+        if embedding is not None:
+            document.update(embedding=embedding, variant=variant)
+        self._pending.append(UpdateOne({"prompt_hash": prompt_hash}, {"$set": document}, upsert=True))
+        if len(self._pending) >= _FLUSH_BATCH:
+            await self._flush()
+    
+    async def _flusher(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            await self._flush()
+    
+    async def _flush(self):
+        """Write out queued analyses; one failed write doesn't stop the rest (ordered=False)"""
+        if not self._pending:
             return
         
+        batch, self._pending = self._pending, []
         try:
-            await self.collection.update_one(
-                {"prompt_hash": prompt_hash},
-                {"$set": {**analysis, "cached_at": datetime.utcnow()}},
-                upsert=True
-            )
-            logger.info(f"Cached analysis for hash: {prompt_hash}")
+            await self.collection.bulk_write(batch, ordered=False)
+            logger.info("Cached %d analyses", len(batch))
         except Exception as e:
-            logger.error(f"Error caching analysis: {e}")
+            logger.error("Error caching analyses: %s", e)
 
 cache_service = CacheService()
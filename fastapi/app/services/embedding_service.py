@@ -0,0 +1,30 @@
+# app/services/embedding_service.py
+import logging
+from typing import List, Optional
+import httpx
+import msgspec
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FEATURE_EXTRACTION_URL = "https://router.huggingface.co/hf-inference/models/{model}/pipeline/feature-extraction"
+
+class EmbeddingService:
+    def __init__(self, http_client: httpx.AsyncClient):
+        # Same pooled client as AIService, so the router connection is already warm
+        self.http_client = http_client
+        self.url = FEATURE_EXTRACTION_URL.format(model=settings.embedding_model)
+        self.headers = {"Authorization": f"Bearer {settings.huggingface_token}"}
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """Sentence embedding for text, or None on failure; the semantic cache is best-effort"""
+        try:
+            response = await self.http_client.post(
+                self.url, json={"inputs": text}, headers=self.headers, timeout=settings.embedding_timeout
+            )
+            response.raise_for_status()
+            return msgspec.json.decode(response.content, type=List[float])
+        except (httpx.HTTPError, msgspec.DecodeError) as e:
+            logger.warning("Embedding failed: %s", e)
+            return None
@@ -0,0 +1,80 @@
+# app/services/local_cache.py
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.fast_hash import hash_string
+
+logger = logging.getLogger(__name__)
+
+# (prompt_key, analysis, expires_at)
+_Entry = Tuple[str, dict, float]
+
+class LocalAnalysisCache:
+    """In-process LRU/TTL cache in front of MongoDB, bucketed by a truncated-endpoint hash"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0, max_chain: int = 4, limit: int = 64):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_chain = max_chain
+        self.limit = limit
+        self._buckets: Dict[int, List[_Entry]] = {}
+        self._size = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached analysis for a prompt_key(), if any"""
+        h = hash_string(key, self.limit)
+        bucket = self._buckets.get(h)
+        if not bucket:
+            return None
+
+        for i, (cached_key, analysis, expires_at) in enumerate(bucket):
+            if cached_key != key:
+                continue
+            # A bad entry only lives until its TTL: forgetting it here would just be refilled from Mongo
+            if expires_at <= time.monotonic():
+                self._remove(h, bucket, i)
+                return None
+            # Most recently used buckets live at the end of the dict
+            self._buckets[h] = self._buckets.pop(h)
+            return analysis
+        return None
+
+    def set(self, key: str, analysis: dict):
+        """Store an analysis, rehashing with a longer prefix when a bucket overflows"""
+        expires_at = time.monotonic() + self.ttl
+        h = hash_string(key, self.limit)
+        bucket = self._buckets.pop(h, [])
+        self._buckets[h] = bucket
+        for i, (cached_key, _, _) in enumerate(bucket):
+            if cached_key == key:
+                bucket[i] = (key, analysis, expires_at)
+                return
+
+        if self._size >= self.max_entries:
+            self._evict_oldest()
+        bucket.append((key, analysis, expires_at))
+        self._size += 1
+
+        if len(bucket) > self.max_chain:
+            self._rehash(self.limit * 2)
+
+    def _remove(self, h: int, bucket: List[_Entry], i: int):
+        del bucket[i]
+        self._size -= 1
+        if not bucket:
+            del self._buckets[h]
+
+    def _evict_oldest(self):
+        oldest = next(iter(self._buckets))
+        self._size -= len(self._buckets.pop(oldest))
+
+    def _rehash(self, limit: int):
+        logger.info("L1 cache chain overflow, rehashing with limit=%d", limit)
+        entries = [entry for bucket in self._buckets.values() for entry in bucket]
+        self.limit = limit
+        self._buckets = {}
+        for entry in entries:
+            self._buckets.setdefault(hash_string(entry[0], limit), []).append(entry)
+
+local_cache = LocalAnalysisCache()
@@ -0,0 +1,12 @@
+# app/utils/fast_hash.py
+
+def hash_string(s: str, limit: int = 64) -> int:
+    """Hash at most `limit` characters taken from both ends of `s`, seeded with its length.
+
+    Only meant for in-process lookups: the underlying hash() is salted per interpreter.
+    """
+    n = len(s)
+    if n <= limit:
+        return hash(s)
+    half = limit // 2
+    return hash((n, s[:half], s[n - half:]))
@@ -0,0 +1,16 @@
+# app/utils/hashing.py
+import hashlib
+from typing import List
+
+def prompt_key(prompt: str, genres: List[str], story_threshold: int) -> str:
+    """Canonical key material for an analysis request"""
+    # Control-character delimiters keep ["a,b"] and ["a", "b"] from colliding
+    return "\x1f".join([prompt, *genres, "\x1e", str(story_threshold)])
+
+def variant_key(genres: List[str], story_threshold: int, mode: str) -> str:
+    """The non-prompt part of prompt_key() plus the analysis mode; semantic cache hits must match it exactly"""
+    return "\x1f".join([*genres, "\x1e", str(story_threshold), mode])
+
+def prompt_digest(key: str) -> str:
+    """Stable, process-independent digest of a prompt_key()"""
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,34 @@
+# app/utils/json_extract.py
+import re
+from typing import Optional
+
+# The only characters that can change brace depth or string state
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+def first_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} block in text, ignoring braces inside string literals"""
+    # Skip any preamble in C; scanning starts at the opening brace, so quotes before it never count
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth, in_string, escaped = 0, False, -1
+    # finditer skips ordinary characters in C, so the Python loop only sees structure
+    for match in _STRUCTURAL.finditer(text, start):
+        i = match.start()
+        if i == escaped:
+            continue
+        c = text[i]
+        if in_string:
+            if c == "\\":
+                escaped = i + 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
@@ -1,50 +1,95 @@
 # app/utils/prompt_builder.py
+import re
 from typing import List
 
-def build_story_prompt(narrative: str, genres: List[str]) -> str:
-    """Build prompt for story mode analysis"""
-    genre_str = ", ".join(genres) if genres else "various genres"
-    
-    return f"""Analyze this story and break it down into 3-6 musical scenes.
+# Sentence boundaries used to cut a story into scene passages
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# A story playlist needs an arc; never cut a story into fewer scenes than this (max_scenes permitting)
+MIN_SCENES = 3
+
+def is_story_prompt(prompt: str, story_threshold: int) -> bool:
+    """True when the prompt has at least story_threshold words"""
+    # N words need at least 2N-1 chars, so short prompts are DIRECT without tokenising;
+    # otherwise maxsplit stops once the threshold is reached
+    return (
+        len(prompt) >= 2 * story_threshold - 1
+        and len(prompt.split(None, story_threshold)) >= story_threshold
+    )
+
+def split_story(narrative: str, max_scenes: int) -> List[str]:
+    """Split a story into contiguous passages, at least MIN_SCENES and at most max_scenes of them"""
+    target = max(1, min(MIN_SCENES, max_scenes))
+    units = [s for s in _SENTENCE_END.split(narrative.strip()) if s]
+    limit = max_scenes
+    if len(units) < target:
+        # Too little punctuation to cut on sentences; fall back to just target even word spans,
+        # so fewer sentences never means more (mid-sentence) scenes
+        units = narrative.split()
+        limit = target
+    if not units:
+        return [narrative]
 
-Story: {narrative}
+    count = max(1, min(limit, len(units)))
+    size, extra = divmod(len(units), count)
+    passages, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        passages.append(" ".join(units[start:end]))
+        start = end
+    return passages
 
-User's preferred genres: {genre_str}
+# Static instructions sent as the system message. They never interpolate request data, so every
+# call of a kind shares a byte-identical prefix that router/vLLM prefix caches can reuse.
+SCENE_SYSTEM_PROMPT = """You are a helpful AI that returns structured JSON only.
+
+You will be given the user's preferred genres, a full story for context, and one scene from that story. Describe the music for that scene only, in keeping with where it sits in the story's arc.
 
 Respond ONLY with valid JSON in this exact format:
-{{
-  "scenes": [
-    {{
-      "description": "brief scene description",
-      "search_query": "A precise Spotify search query for this scene. Combine musical keywords, moods, and relevant genres from the user's preferences. Example: 'slow ambient hopeful sunrise' or 'chaotic high-energy world music market'"
-    }}
-  ]
-}}
+{
+  "description": "brief scene description",
+  "search_query": "A precise Spotify search query for this scene. Combine musical keywords, moods, and relevant genres from the user's preferences. Example: 'slow ambient hopeful sunrise' or 'chaotic high-energy world music market'"
+}
 
 Rules:
-- Maximum 6 scenes
-- Keep descriptions under 100 characters
+- Keep the description under 100 characters
 - The "search_query" MUST be a string optimized for the Spotify search API.
 - The "search_query" should incorporate the scene's mood AND the user's preferred genres."""
 
-def build_direct_prompt(prompt: str, genres: List[str]) -> str:
-    """Build prompt for direct mode analysis"""
-    genre_str = ", ".join(genres) if genres else "any genre"
-    
-    return f"""Analyze this music request and extract key information.
-
-Request: {prompt}
+DIRECT_SYSTEM_PROMPT = """You are a helpful AI that returns structured JSON only.
 
-User's preferred genres: {genre_str}
+You will be given a music request and the user's preferred genres. Analyze the request and extract key information.
 
 Respond ONLY with valid JSON in this exact format:
-{{
+{
   "theme": "A short, catchy theme or title for this playlist. Example: 'Rainy Day Reading' or 'Cyberpunk Chase'",
   "search_query": "A precise Spotify search query to find this vibe. Combine the user's prompt keywords, mood, and preferred genres. Example: 'chill rainy afternoon acoustic jazz' or 'dark futuristic electronic' or 'afrobeats for driving'"
-}}
+}
 
 Rules:
 - "theme" should be under 50 characters.
 - "search_query" MUST be a string optimized for the Spotify search API.
 - "search_query" MUST include relevant user preferred genres.
-- "search_query" MUST NOT include non-musical keywords like 'Lekki' or 'traffic'. Infer the vibe (e.g., 'driving' or 'frustrated') instead."""
\ No newline at end of file
+- "search_query" MUST NOT include non-musical keywords like 'Lekki' or 'traffic'. Infer the vibe (e.g., 'driving' or 'frustrated') instead."""
+
+def build_scene_prompt(
+    story: str, passage: str, scene_number: int, total_scenes: int, genres: List[str]
+) -> str:
+    """Build the user message for a single story-mode scene, with the whole story for context"""
+    genre_str = ", ".join(genres) if genres else "various genres"
+    
+    # Per-scene text goes last: every scene of a request shares the system prompt, genre line and
+    # full story as a prefix, and each scene still sees the story arc around its passage
+    return f"""User's preferred genres: {genre_str}
+
+Full story: {story}
+
+Scene {scene_number} of {total_scenes}: {passage}"""
+
+def build_direct_prompt(prompt: str, genres: List[str]) -> str:
+    """Build the user message for direct mode analysis"""
+    genre_str = ", ".join(genres) if genres else "any genre"
+    
+    return f"""User's preferred genres: {genre_str}
+
+Request: {prompt}"""
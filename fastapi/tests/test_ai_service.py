@@ -0,0 +1,105 @@
+# tests/test_ai_service.py
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services import ai_service as ai_module
+from app.services.ai_service import AIService
+
+STORY = " ".join(f"Sentence number {i} happens here." for i in range(12))
+
+class FakeRouter:
+    """httpx MockTransport handler that answers chat completions after a short delay"""
+
+    def __init__(self, delay: float = 0.05, bad_scene: int = 0):
+        self.delay = delay
+        self.bad_scene = bad_scene
+        self.requests = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        prompt = json.loads(request.content)["messages"][-1]["content"]
+        if self.bad_scene and f"Scene {self.bad_scene} of" in prompt:
+            content = "Sorry, I can't help with that."
+        else:
+            content = '{"theme": "t", "description": "d", "search_query": "q"}'
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+@pytest.fixture(autouse=True)
+def _token(monkeypatch):
+    monkeypatch.setattr(ai_module.settings, "huggingface_token", "test-token")
+
+def _run(router: FakeRouter, scenario):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(router)) as client:
+            return await scenario(AIService(client))
+    return asyncio.run(run())
+
+def test_concurrent_identical_requests_share_one_run():
+    router = FakeRouter()
+
+    async def scenario(service):
+        results = await asyncio.gather(
+            *(service.analyze_prompt("rainy day drive", [], 30, "a" * 32) for _ in range(5))
+        )
+        assert router.requests == 1
+        assert len({id(result) for result in results}) == 1
+        assert service._inflight == {}
+
+    _run(router, scenario)
+
+def test_different_requests_run_separately():
+    router = FakeRouter()
+
+    async def scenario(service):
+        await asyncio.gather(
+            service.analyze_prompt("rainy day drive", [], 30, "a" * 32),
+            service.analyze_prompt("sunny beach day", [], 30, "b" * 32)
+        )
+        assert router.requests == 2
+
+    _run(router, scenario)
+
+def test_cancelled_caller_does_not_cancel_shared_run():
+    router = FakeRouter()
+
+    async def scenario(service):
+        first = asyncio.ensure_future(service.analyze_prompt(STORY, ["rock"], 30, "c" * 32))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(service.analyze_prompt(STORY, ["rock"], 30, "c" * 32))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        result = await second
+
+        assert first.cancelled()
+        assert len(result.scenes) == 5 and result.cacheable
+        assert router.requests == 5
+        assert service._inflight == {}
+
+    _run(router, scenario)
+
+def test_entry_removed_after_completion_so_next_call_runs_again():
+    router = FakeRouter()
+
+    async def scenario(service):
+        await service.analyze_prompt("rainy day drive", [], 30, "a" * 32)
+        assert service._inflight == {}
+        await service.analyze_prompt("rainy day drive", [], 30, "a" * 32)
+        assert router.requests == 2
+
+    _run(router, scenario)
+
+def test_one_fallback_scene_makes_response_uncacheable():
+    router = FakeRouter(bad_scene=2)
+
+    async def scenario(service):
+        result = await service.analyze_prompt(STORY, ["rock"], 30, "d" * 32)
+        fallbacks = [scene.scene_number for scene in result.scenes if scene.is_fallback]
+        assert fallbacks == [2]
+        assert not result.cacheable
+
+    _run(router, scenario)
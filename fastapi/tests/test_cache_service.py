@@ -0,0 +1,94 @@
+# tests/test_cache_service.py
+import asyncio
+
+from app.services import cache_service as cs
+
+class FakeCollection:
+    """Stand-in for the Motor collection with a slow, optionally failing bulk_write"""
+
+    def __init__(self, delay: float = 0.0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.written = []
+
+    async def bulk_write(self, ops, ordered):
+        assert ordered is False
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("write failed")
+        self.written += [op._filter["prompt_hash"] for op in ops]
+
+def _service(collection: FakeCollection) -> cs.CacheService:
+    service = cs.CacheService()
+    service.collection = collection
+    service._flush_task = asyncio.create_task(service._flusher())
+    return service
+
+def test_write_queued_during_inflight_bulk_write_lands_after_close():
+    async def run():
+        collection = FakeCollection(delay=0.2)
+        service = _service(collection)
+        for i in range(3):
+            await service.cache_analysis(f"h{i}", {"mode": "DIRECT"})
+        # The flusher picks the batch up after _FLUSH_INTERVAL and is then inside bulk_write
+        await asyncio.sleep(cs._FLUSH_INTERVAL + 0.05)
+        assert collection.calls == 1 and not collection.written
+        await service.cache_analysis("late", {"mode": "DIRECT"})
+
+        await service.close()
+
+        assert collection.written == ["h0", "h1", "h2", "late"]
+        assert service._pending == []
+        assert service._flush_task.done()
+    asyncio.run(run())
+
+def test_full_batch_flushes_immediately():
+    async def run():
+        collection = FakeCollection()
+        service = cs.CacheService()
+        service.collection = collection
+        # No flusher running: only the batch-size trigger can write
+        for i in range(cs._FLUSH_BATCH - 1):
+            await service.cache_analysis(f"h{i}", {"mode": "DIRECT"})
+        assert collection.calls == 0
+
+        await service.cache_analysis("last", {"mode": "DIRECT"})
+
+        assert collection.calls == 1
+        assert len(collection.written) == cs._FLUSH_BATCH
+        assert service._pending == []
+    asyncio.run(run())
+
+def test_failed_bulk_write_drops_batch_and_flusher_survives():
+    async def run():
+        collection = FakeCollection(failures=1)
+        service = _service(collection)
+        await service.cache_analysis("lost", {"mode": "DIRECT"})
+        await asyncio.sleep(cs._FLUSH_INTERVAL * 2)
+        assert collection.calls == 1
+        assert service._pending == []
+        assert not service._flush_task.done()
+
+        await service.cache_analysis("kept", {"mode": "DIRECT"})
+        await asyncio.sleep(cs._FLUSH_INTERVAL * 2)
+
+        assert collection.written == ["kept"]
+        await service.close()
+    asyncio.run(run())
+
+def test_semantic_hit_has_the_exact_lookup_shape():
+    class VectorCollection:
+        async def aggregate(self, pipeline):
+            self.pipeline = pipeline
+            yield {"analysis_id": "ai-1", "mode": "DIRECT", "direct_analysis": {}, "score": 0.99}
+
+    async def run():
+        service = cs.CacheService()
+        service.collection = VectorCollection()
+        result = await service.get_semantically_cached([0.1, 0.2], "variant", 0.9)
+        assert result["score"] == 0.99
+        assert service.collection.pipeline[-1] == {"$project": {**cs._ANALYSIS_PROJECTION, "score": 1}}
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+# tests/test_json_extract.py
+import json
+
+from app.utils.json_extract import first_json_object
+
+def test_bare_object():
+    assert first_json_object('{"a": 1}') == '{"a": 1}'
+
+def test_skips_preamble_and_trailing_prose():
+    text = 'Sure! Here it is: {"theme": "rain", "search_query": "lofi"} Hope that helps {}'
+    assert first_json_object(text) == '{"theme": "rain", "search_query": "lofi"}'
+
+def test_nested_objects():
+    text = 'x {"a": {"b": {"c": 1}}, "d": 2} y'
+    assert json.loads(first_json_object(text)) == {"a": {"b": {"c": 1}}, "d": 2}
+
+def test_braces_inside_strings():
+    text = '{"description": "a } closing and { opening", "search_query": "}{"} tail}'
+    assert json.loads(first_json_object(text)) == {"description": "a } closing and { opening", "search_query": "}{"}
+
+def test_escaped_quote_inside_string():
+    text = r'{"description": "she said \"}\" loudly", "n": 1} {"other": 2}'
+    assert json.loads(first_json_object(text)) == {"description": 'she said "}" loudly', "n": 1}
+
+def test_escaped_backslash_before_closing_quote():
+    text = r'{"path": "C:\\", "n": 1} {"other": 2}'
+    assert json.loads(first_json_object(text)) == {"path": "C:\\", "n": 1}
+
+def test_quotes_before_first_brace_are_ignored():
+    assert first_json_object('He said "hi" then {"a": "b"}') == '{"a": "b"}'
+
+def test_no_object():
+    assert first_json_object("no json here") is None
+
+def test_unbalanced_object():
+    assert first_json_object('{"a": {"b": 1}') is None
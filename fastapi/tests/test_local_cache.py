@@ -0,0 +1,54 @@
+# tests/test_local_cache.py
+from app.services.local_cache import LocalAnalysisCache
+from app.utils.fast_hash import hash_string
+
+def _colliding_keys(count, limit):
+    # Same length and same first/last limit/2 chars, so hash_string() puts them in one bucket
+    half = limit // 2
+    return [f"{'a' * half}{i:04d}{'z' * half}" for i in range(count)]
+
+def test_get_returns_stored_analysis():
+    cache = LocalAnalysisCache()
+    cache.set("key", {"mode": "DIRECT"})
+    assert cache.get("key") == {"mode": "DIRECT"}
+    assert cache.get("missing") is None
+
+def test_set_replaces_existing_entry():
+    cache = LocalAnalysisCache()
+    cache.set("key", {"v": 1})
+    cache.set("key", {"v": 2})
+    assert cache.get("key") == {"v": 2}
+    assert cache._size == 1
+
+def test_chain_overflow_rehashes_with_longer_prefix():
+    cache = LocalAnalysisCache(max_chain=2, limit=4)
+    keys = _colliding_keys(3, 4)
+    assert len({hash_string(k, 4) for k in keys}) == 1
+
+    for i, key in enumerate(keys):
+        cache.set(key, {"i": i})
+
+    assert cache.limit == 8
+    assert all(len(bucket) <= cache.max_chain for bucket in cache._buckets.values())
+    assert [cache.get(key) for key in keys] == [{"i": 0}, {"i": 1}, {"i": 2}]
+    assert cache._size == 3
+
+def test_evicts_least_recently_used_at_max_entries():
+    cache = LocalAnalysisCache(max_entries=2)
+    cache.set("first", {"v": 1})
+    cache.set("second", {"v": 2})
+    assert cache.get("first") == {"v": 1}
+
+    cache.set("third", {"v": 3})
+
+    assert cache.get("second") is None
+    assert cache.get("first") == {"v": 1}
+    assert cache.get("third") == {"v": 3}
+    assert cache._size == 2
+
+def test_expired_entry_is_dropped():
+    cache = LocalAnalysisCache(ttl=0)
+    cache.set("key", {"v": 1})
+    assert cache.get("key") is None
+    assert cache._size == 0
+    assert not cache._buckets
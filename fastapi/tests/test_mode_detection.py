@@ -0,0 +1,45 @@
+# tests/test_mode_detection.py
+import pytest
+
+from app.utils.prompt_builder import is_story_prompt, split_story
+
+@pytest.mark.parametrize("threshold", [1, 5, 100])
+def test_threshold_boundary(threshold):
+    assert not is_story_prompt(" ".join(["word"] * (threshold - 1)), threshold)
+    assert is_story_prompt(" ".join(["word"] * threshold), threshold)
+    assert is_story_prompt(" ".join(["word"] * (threshold + 1)), threshold)
+
+def test_shortest_possible_story_passes_length_guard():
+    # N one-letter words need exactly 2N-1 chars
+    prompt = " ".join("abcde")
+    assert len(prompt) == 2 * 5 - 1
+    assert is_story_prompt(prompt, 5)
+    assert not is_story_prompt(prompt[:-2], 5)
+
+def test_long_prompt_with_few_words_is_direct():
+    assert not is_story_prompt("supercalifragilistic " * 4, 5)
+
+def test_extra_whitespace_does_not_count_as_words():
+    assert not is_story_prompt("a  b\n\nc\t d   ", 5)
+    assert is_story_prompt("a  b\n\nc\t d   e", 5)
+
+def test_split_story_keeps_at_least_three_scenes():
+    passages = split_story("One long sentence without any breaks", 5)
+    assert len(passages) == 3
+    assert " ".join(passages) == "One long sentence without any breaks"
+
+def test_split_story_caps_at_max_scenes():
+    story = " ".join(f"Sentence {i} happens." for i in range(12))
+    passages = split_story(story, 5)
+    assert len(passages) == 5
+    assert " ".join(passages).split() == story.split()
+
+def test_split_story_scene_count_does_not_drop_with_more_sentences():
+    words = " ".join(["word"] * 59)
+    two_sentences = f"{words} one. {words} two."
+    three_sentences = f"{words} one. {words} two. Then it ends."
+    assert len(split_story(two_sentences, 5)) == 3
+    assert len(split_story(three_sentences, 5)) == 3
+
+def test_split_story_word_fallback_respects_small_max_scenes():
+    assert len(split_story("no punctuation in this story at all", 2)) == 2
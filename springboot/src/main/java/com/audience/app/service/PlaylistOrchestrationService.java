@@ -22,6 +22,9 @@ import reactor.core.publisher.Mono;
 
 import java.time.Duration;
 import java.util.*;
+import java.util.concurrent.CompletableFuture;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
 import java.util.regex.Pattern; // Import Pattern
 import java.util.stream.Collectors;
 import java.util.stream.Stream;
@@ -149,6 +152,22 @@ public class PlaylistOrchestrationService {
                 ? request.getTracksPerScene()
                 : defaultTracksPerScene;
         String accessToken = user.getAccessToken();
+        int searchLimit = tracksPerScene * 2 + 10; // Fetch more tracks than needed to account for filtering
+
+        // Scene searches are independent, so run them concurrently; results are still consumed in
+        // scene order below, which keeps the cross-scene de-duplication deterministic
+        Map<SceneAnalysis, CompletableFuture<List<Map<String, Object>>>> searches = new IdentityHashMap<>();
+        try (ExecutorService executor = Executors.newVirtualThreadPerTaskExecutor()) {
+            for (SceneAnalysis sceneAnalysis : aiAnalysis.getScenes()) {
+                if (sceneAnalysis == null || !StringUtils.hasText(sceneAnalysis.getSearchQuery())) {
+                    continue;
+                }
+                String query = sceneAnalysis.getSearchQuery();
+                log.info("Calling Spotify search for scene {}: '{}'", sceneAnalysis.getSceneNumber(), query);
+                searches.put(sceneAnalysis, CompletableFuture.supplyAsync(
+                        () -> spotifyService.searchTracks(query, searchLimit, accessToken), executor));
+            }
+        } // close() waits for every search to finish
 
         for (SceneAnalysis sceneAnalysis : aiAnalysis.getScenes()) {
             if (sceneAnalysis == null) {
@@ -170,10 +189,7 @@ public class PlaylistOrchestrationService {
                     .tracks(new ArrayList<>())
                     .build();
 
-            log.info("Calling Spotify search for scene {}: '{}'", scene.getSceneNumber(), query);
-
-            // Fetch more tracks than needed to account for filtering
-            List<Map<String, Object>> spotifyTracks = spotifyService.searchTracks(query, tracksPerScene * 2 + 10, accessToken); // Fetch extra
+            List<Map<String, Object>> spotifyTracks = searches.get(sceneAnalysis).join();
 
             // Filter, de-duplicate, and map
             List<Track> tracks = mapAndAssociateTracks(spotifyTracks, scene, addedTrackIds, tracksPerScene);